@@ -1,16 +1,116 @@
-from flask import Flask
+from flask import Flask, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from routes import api
+from routes import api, load_time_cache
+from db import engine
+from sqlalchemy import event
+from collections import Counter
+from datetime import timedelta
+import logging
+import orjson
 import os 
 
+# One handler for the whole app; set LOG_LEVEL=DEBUG to see per-request route logging
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify() through orjson. Datetimes come out as ISO 8601; types orjson
+    doesn't know (Decimal, UUID, ...) fall back to Flask's default handling.
+    Honors sort_keys and compact like DefaultJSONProvider (orjson only indents by 2).
+    """
+    base_option = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+    def _option(self, sort_keys, indent):
+        option = self.base_option
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        option = self._option(kwargs.get("sort_keys", self.sort_keys), kwargs.get("indent"))
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        # The cookie session passes object_hook to untag values (flash tuples etc.),
+        # which orjson doesn't support
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._option(self.sort_keys, indent)),
+            mimetype=self.mimetype,
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
+# Keep session data in Redis so only the session ID travels in the cookie.
+# Without REDIS_URL (local dev) Flask's default cookie sessions are used.
+app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=24)
+if os.environ.get("REDIS_URL"):
+    import redis
+    from flask_session import Session
+
+    app.config.update(
+        SESSION_TYPE="redis",
+        SESSION_REDIS=redis.from_url(os.environ["REDIS_URL"]),
+        SESSION_USE_SIGNER=True,
+        SESSION_PERMANENT=True,  # Redis keys expire after PERMANENT_SESSION_LIFETIME
+    )
+    Session(app)
+
 CORS(app)
 
+# Development guard against N+1 query fan-out. nplusone only hooks ORM lazy loads and
+# this app runs Core text() queries, so count identical statements per request instead.
+# Set QUERY_FANOUT_RAISE=1 in test environments to turn the response into a 500.
+# Queries run on db_executor have no request context and are not counted.
+app.config["QUERY_FANOUT_LIMIT"] = int(os.environ.get("QUERY_FANOUT_LIMIT", "3"))
+app.config["QUERY_FANOUT_RAISE"] = os.environ.get("QUERY_FANOUT_RAISE") == "1"
+if app.debug or app.config["QUERY_FANOUT_RAISE"]:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _check_query_fanout(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        counts = g.setdefault("statement_counts", Counter())
+        counts[statement] += 1
+        if counts[statement] == app.config["QUERY_FANOUT_LIMIT"] + 1:
+            message = f"Possible N+1 in {request.path}: statement ran {counts[statement]} times: {statement.strip()[:200]}"
+            logger.warning(message)
+            # Raising here would be swallowed by the views' except blocks; fail the response instead
+            g.setdefault("query_fanout_violations", []).append(message)
+
+    @app.after_request
+    def _fail_on_query_fanout(response):
+        violations = g.get("query_fanout_violations")
+        if violations and app.config["QUERY_FANOUT_RAISE"]:
+            return app.response_class("\n".join(violations), status=500, mimetype="text/plain")
+        return response
+
 # Register your API blueprint
 app.register_blueprint(api)
 
+# Preload the tblTimes lookup so the first request doesn't pay for it
+try:
+    load_time_cache()
+except Exception as e:
+    logger.warning("Could not preload time cache: %s", e)
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    # Development only; production runs under gunicorn (see gunicorn_conf.py)
+    app.run(host='0.0.0.0', port=3000, debug=False)
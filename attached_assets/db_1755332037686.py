@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
 import os
 
@@ -10,4 +11,16 @@ def get_database_url():
     encoded_password = quote_plus(password)
     return f"mssql+pymssql://{username}:{encoded_password}@{server}/{database}"
 
-engine = create_engine(get_database_url(), echo=False)
+engine = create_engine(
+    get_database_url(),
+    echo=False,
+    pool_size=int(os.environ.get("CRMSRV_POOL_SIZE", "20")),
+    max_overflow=int(os.environ.get("CRMSRV_MAX_OVERFLOW", "10")),
+    pool_pre_ping=True,  # drop connections MSSQL has closed instead of failing the request
+    pool_recycle=int(os.environ.get("CRMSRV_POOL_RECYCLE", "1800")),
+    future=True,
+)
+
+# Shared pool for overlapping independent DB round trips within a request.
+# pymssql releases the GIL during network I/O; keep this below the engine pool size.
+db_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CRMSRV_EXECUTOR_WORKERS", "8")))
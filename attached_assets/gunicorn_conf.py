@@ -0,0 +1,21 @@
+# Production server config: gunicorn -c gunicorn_conf.py main:app
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import gevent.socket
+import pymssql
+
+
+def _gevent_wait_callback(read_fileno):
+    # pymssql talks to FreeTDS sockets in C, which monkey-patching can't reach;
+    # this hook lets a query wait on the socket cooperatively instead of blocking the worker
+    gevent.socket.wait_read(read_fileno)
+
+
+pymssql.set_wait_callback(_gevent_wait_callback)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '3000')}"
+worker_class = "gevent"
+workers = int(os.environ.get("GUNICORN_WORKERS", (os.cpu_count() or 1) * 2))
+worker_connections = 1000
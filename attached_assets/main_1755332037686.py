@@ -1,7 +1,13 @@
 import os
-from flask import render_template, request, redirect, url_for, flash, session
+import json
+import hashlib
+import logging
+from flask import render_template, request, redirect, url_for, flash, session, make_response, Response
 from app import app
-from routes import find_inquiry_by_contact_phone, get_sessions, get_hours_balance
+from db import db_executor
+from routes import find_inquiry_by_contact_phone, get_sessions_bulk, get_hours_balance, invalidate_hours_balance
+
+logger = logging.getLogger(__name__)
 
 def require_auth(f):
     """Decorator to require authentication"""
@@ -60,6 +66,9 @@ def register():
 
 @app.route('/logout')
 def logout():
+    # Next login should see a fresh balance rather than the cached one
+    if 'inquiry_id' in session:
+        invalidate_hours_balance(session['inquiry_id'])
     session.clear()
     flash('You have been logged out successfully.', 'success')
     return redirect(url_for('login'))
@@ -74,40 +83,41 @@ def serve_image(filename):
 @require_auth
 def index():
     """Main dashboard page with combined schedule and billing data"""
-    try:
-        # Ensure we have valid session data before proceeding
-        if 'contact_number' not in session or 'inquiry_id' not in session:
-            session.clear()
-            flash('Session expired. Please log in again.', 'warning')
-            return redirect(url_for('login'))
-            
-        inquiry_id = session.get('inquiry_id')
-        student_ids = session.get('student_ids', [])
+    # require_auth has already checked the session; read what we need once
+    inquiry_id = session['inquiry_id']
+    student_ids = session.get('student_ids', [])
+    students = session.get('students', [])
+    username = session.get('username')
 
-        # Get real session data for each student
-        print(f"DEBUG MAIN: Getting sessions for student_ids: {student_ids}")
+    try:
+        # Sessions and balance don't depend on each other: fetch them concurrently
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("MAIN: Getting sessions for student_ids: %s", student_ids)
+        balance_future = db_executor.submit(get_hours_balance, inquiry_id) if inquiry_id else None
+        sessions_by_student = get_sessions_bulk(student_ids)
         all_sessions = []
         for student_id in student_ids:
-            print(f"DEBUG MAIN: Processing student_id: {student_id}")
-            student_sessions = get_sessions(student_id)
-            print(f"DEBUG MAIN: Got {len(student_sessions)} sessions for student {student_id}")
+            student_sessions = sessions_by_student.get(student_id, [])
+            if debug:
+                logger.debug("MAIN: Got %d sessions for student %s", len(student_sessions), student_id)
             all_sessions.extend(student_sessions)
 
-        print(f"DEBUG MAIN: Total sessions across all students: {len(all_sessions)}")
-
-        # Separate recent and upcoming sessions
-        recent_sessions = [s for s in all_sessions if s.get('category') == 'recent']
-        upcoming_sessions = [s for s in all_sessions if s.get('category') == 'upcoming']
-        
-        print(f"DEBUG MAIN: Separated into {len(recent_sessions)} recent and {len(upcoming_sessions)} upcoming sessions")
+        if debug:
+            # Separate recent and upcoming sessions
+            recent_count = sum(1 for s in all_sessions if s.get('category') == 'recent')
+            upcoming_count = sum(1 for s in all_sessions if s.get('category') == 'upcoming')
+            logger.debug("MAIN: Total sessions across all students: %d", len(all_sessions))
+            logger.debug("MAIN: Separated into %d recent and %d upcoming sessions", recent_count, upcoming_count)
 
         # Get balance data
-        balance_info = get_hours_balance(inquiry_id) if inquiry_id else {}
-        print(f"DEBUG MAIN: Balance info: {balance_info}")
+        balance_info = balance_future.result() if balance_future else {}
+        if debug:
+            logger.debug("MAIN: Balance info: %s", balance_info)
 
         return render_template('index.html',
-                             username=session.get('username'),
-                             students=session.get('students', []),
+                             username=username,
+                             students=students,
                              sessions=all_sessions,
                              balance_data=balance_info)
 
@@ -115,8 +125,8 @@ def index():
         flash(f'Error loading dashboard: {str(e)}', 'warning')
         # Fallback to empty data
         return render_template('index.html',
-                             username=session.get('username'),
-                             students=session.get('students', []),
+                             username=username,
+                             students=students,
                              sessions=[],
                              balance_data={})
 
@@ -124,30 +134,36 @@ def index():
 @require_auth
 def schedule():
     """Schedule tab"""
-    try:
-        student_ids = session.get('student_ids', [])
+    student_ids = session.get('student_ids', [])
+    students = session.get('students', [])
+    username = session.get('username')
 
+    try:
         # Get real session data for each student
-        print(f"DEBUG SCHEDULE ROUTE: Getting sessions for student_ids: {student_ids}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("SCHEDULE ROUTE: Getting sessions for student_ids: %s", student_ids)
+        sessions_by_student = get_sessions_bulk(student_ids)
         all_sessions = []
         for student_id in student_ids:
-            print(f"DEBUG SCHEDULE ROUTE: Processing student_id: {student_id}")
-            student_sessions = get_sessions(student_id)
-            print(f"DEBUG SCHEDULE ROUTE: Got {len(student_sessions)} sessions for student {student_id}")
+            student_sessions = sessions_by_student.get(student_id, [])
+            if debug:
+                logger.debug("SCHEDULE ROUTE: Got %d sessions for student %s", len(student_sessions), student_id)
             all_sessions.extend(student_sessions)
 
-        print(f"DEBUG SCHEDULE ROUTE: Total sessions for schedule page: {len(all_sessions)}")
+        if debug:
+            logger.debug("SCHEDULE ROUTE: Total sessions for schedule page: %d", len(all_sessions))
 
         return render_template('schedule.html',
                              sessions=all_sessions,
-                             students=session.get('students', []),
-                             username=session.get('username'))
+                             students=students,
+                             username=username)
     except Exception as e:
         flash(f'Error loading schedule: {str(e)}', 'warning')
         return render_template('schedule.html',
                              sessions=[],
-                             students=session.get('students', []),
-                             username=session.get('username'))
+                             students=students,
+                             username=username)
 
 @app.route('/schedule_change_request', methods=['POST'])
 @require_auth
@@ -169,17 +185,32 @@ def schedule_change_request():
         flash(f'Error submitting request: {str(e)}', 'danger')
         return redirect(url_for('schedule'))
 
+def _billing_etag(inquiry_id, balance_info, students, username):
+    # Built from what the page shows, so every worker derives the same tag for the same data
+    key = json.dumps([inquiry_id, balance_info, students, username], sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
 @app.route('/billing')
 @require_auth
 def billing():
     """Billing tab"""
-    try:
-        inquiry_id = session.get('inquiry_id')
-        students = session.get('students', [])
+    inquiry_id = session['inquiry_id']
+    students = session.get('students', [])
+    username = session.get('username')
 
+    try:
         # Get balance data
         balance_info = get_hours_balance(inquiry_id) if inquiry_id else {}
 
+        # Same data as the browser's copy: answer 304 instead of rendering again.
+        # Skip when flashed messages are waiting to be shown.
+        etag = _billing_etag(inquiry_id, balance_info, students, username)
+        if etag in request.if_none_match and '_flashes' not in session:
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            not_modified.headers['Cache-Control'] = 'private, no-cache'
+            return not_modified
+
         # Format balance data for billing table
         balance_table_data = []
         if balance_info and students:
@@ -191,18 +222,22 @@ def billing():
                     'LastPayment': 'N/A'  # You can add this field later if needed
                 })
 
-        return render_template('billing.html',
+        response = make_response(render_template('billing.html',
                              balance_data=balance_info,
                              balance_table_data=balance_table_data,
                              students=students,
-                             username=session.get('username'))
+                             username=username))
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         flash(f'Error loading billing: {str(e)}', 'warning')
         return render_template('billing.html',
                              balance_data={},
                              balance_table_data=[],
-                             students=session.get('students', []),
-                             username=session.get('username'))
+                             students=students,
+                             username=username)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=3000, debug=False)
\ No newline at end of file
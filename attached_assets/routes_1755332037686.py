@@ -1,184 +1,327 @@
 from flask import Blueprint, request, jsonify
-from sqlalchemy import text
-from db import engine
-from datetime import datetime, timedelta
-from dateutil.parser import parse
+from sqlalchemy import text, bindparam
+from db import engine, db_executor
+from datetime import date, datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from contextlib import closing
+import logging
+import threading
 
 api = Blueprint('api', __name__)
 
+logger = logging.getLogger(__name__)
+
+# tblTimes is small, static reference data: keep {ID: "1:00 PM"} in memory.
+# IDs looked up but not found (or with a NULL Time) are stored as None until the next reload.
+_TIME_CACHE = {}
+_TIME_CACHE_LOCK = threading.Lock()
+_TIME_CACHE_TTL = timedelta(hours=1)
+_time_cache_loaded_at = None
+
+# Formatted strings keyed by the raw tblTimes.Time value (a handful of distinct times of day)
+_FORMATTED_TIME_CACHE = {}
+
+# Balances change rarely between clicks: keep {inquiry_id: (loaded_at, balance)} briefly
+_BALANCE_CACHE = {}
+_BALANCE_CACHE_LOCK = threading.Lock()
+_BALANCE_CACHE_TTL = timedelta(seconds=60)
+_BALANCE_CACHE_MAX = 4096
+
+# --- SQL statements ---
+# Built once at import so each request reuses the same text() objects
+
+_SQL_ALL_TIMES = text("""
+    SELECT ID, Time
+    FROM tblTimes
+""")
+
+_SQL_TIMES_BY_IDS = text("""
+    SELECT ID, Time
+    FROM tblTimes
+    WHERE ID IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+_SQL_INQUIRY_WITH_STUDENTS = text("""
+    SELECT i.ID AS InquiryID, i.Email, i.ContactPhone,
+           s.ID AS StudentID, s.FirstName, s.LastName
+    FROM tblInquiry i
+    LEFT JOIN tblstudents s ON s.InquiryID = i.ID
+    WHERE i.ContactPhone = :cn
+""")
+
+_SQL_SESSIONS_BY_STUDENTS = text("""
+    SELECT Day, TimeID, ScheduleDate, StudentId1,
+           CASE WHEN ScheduleDate < :today THEN 'recent' ELSE 'upcoming' END AS category
+    FROM dpinkney_TC.dbo.tblSessionSchedule 
+    WHERE StudentId1 IN :ids
+      AND ScheduleDate >= :month_start
+      AND ScheduleDate < :next_month_start
+    ORDER BY CASE WHEN ScheduleDate < :today THEN 0 ELSE 1 END, ScheduleDate
+""").bindparams(bindparam("ids", expanding=True))
+
 # --- Helper functions ---
 
-def get_time(time_id):
-    sql = text("""
-        SELECT Time
-        FROM tblTimes
-        WHERE ID = :tid
-    """)
-    with engine.connect() as conn:
-        result = conn.execute(sql, {"tid": time_id}).fetchone()
-        
-        if result and result.Time:
-            # result.Time is a time object or string like '13:00:00'
-            time_obj = datetime.strptime(str(result.Time), "%H:%M:%S")
-            formatted_time = time_obj.strftime("%I:%M %p").lstrip("0")  # e.g. "1:00 PM"
-            
-            return formatted_time
-        
-        return None
+def format_time(raw_time):
+    # raw_time is a time object or string like '13:00:00'
+    formatted = _FORMATTED_TIME_CACHE.get(raw_time)
+    if formatted is None:
+        time_obj = datetime.strptime(str(raw_time), "%H:%M:%S")
+        formatted = time_obj.strftime("%I:%M %p").lstrip("0")  # e.g. "1:00 PM"
+        _FORMATTED_TIME_CACHE[raw_time] = formatted
+    return formatted
 
 
-def find_inquiry_by_contact_phone(contact_num):
-    # Step 1: Find the Inquiry ID from the parent's contact number
-    parent_sql = text("""
-        SELECT ID AS InquiryID, Email, ContactPhone
-        FROM tblInquiry
-        WHERE ContactPhone = :cn
-    """)
+def load_time_cache(conn=None, force=False):
+    """
+    Load all of tblTimes into _TIME_CACHE.
+    Skipped while the cache is younger than _TIME_CACHE_TTL unless force=True.
+    """
+    global _TIME_CACHE, _time_cache_loaded_at
 
-    with engine.connect() as conn:
-        parent_result = conn.execute(parent_sql, {"cn": contact_num}).fetchone()
+    def is_fresh():
+        loaded_at = _time_cache_loaded_at
+        return loaded_at is not None and datetime.now() - loaded_at < _TIME_CACHE_TTL
 
-        if not parent_result:
-            return None  # No parent found
+    # Fast path: no lock while the cache is fresh
+    if not force and is_fresh():
+        return
 
-        inquiry_id = parent_result.InquiryID
+    # Once loaded, a stale cache is still usable: let one thread reload it
+    # while the others carry on instead of queueing behind the query
+    blocking = force or _time_cache_loaded_at is None
+    if not _TIME_CACHE_LOCK.acquire(blocking=blocking):
+        return
+    try:
+        if not force and is_fresh():
+            return
+
+        if conn is not None:
+            rows = conn.execute(_SQL_ALL_TIMES).fetchall()
+        else:
+            with engine.connect() as own_conn:
+                rows = own_conn.execute(_SQL_ALL_TIMES).fetchall()
+
+        # Swap in a new dict so readers never see a half-filled cache
+        fmt = format_time
+        _TIME_CACHE = {tid: fmt(raw) if raw else None for tid, raw in rows}
+        _time_cache_loaded_at = datetime.now()
+    finally:
+        _TIME_CACHE_LOCK.release()
 
-        # Step 2: Find the student(s) linked to that Inquiry ID
-        student_sql = text("""
-            SELECT ID, FirstName, LastName
-            FROM tblstudents
-            WHERE InquiryID = :inquiry_id
-        """)
-        student_results = conn.execute(student_sql, {"inquiry_id": inquiry_id}).fetchall()
 
-        return {
-            "inquiry": dict(parent_result._mapping),
-            "students": [dict(row._mapping) for row in student_results]
-        }
+def get_times_bulk(time_ids, conn):
+    """
+    Look up formatted times for many TimeIDs.
+    Served from _TIME_CACHE; only IDs the cache has never seen hit the database,
+    in a single round trip, and IDs that come back empty are remembered as None.
+    Returns a dict of {TimeID: "1:00 PM"}; IDs with no time are left out.
+    """
+    time_ids = list(time_ids)
+    if not time_ids:
+        return {}
+
+    load_time_cache(conn)
+
+    cache = _TIME_CACHE
+    missing = [tid for tid in time_ids if tid not in cache]
+    if missing:
+        result = conn.execute(_SQL_TIMES_BY_IDS, {"ids": missing})
+        fmt = format_time
+        fetched = dict.fromkeys(missing)
+        fetched.update({tid: fmt(raw) for tid, raw in result if raw})
+        with _TIME_CACHE_LOCK:
+            _TIME_CACHE.update(fetched)
+        cache = {**cache, **fetched}
+
+    return {tid: cache[tid] for tid in time_ids if cache.get(tid)}
+
+
+def find_inquiry_by_contact_phone(contact_num):
+    # Parent and their student(s) in one round trip; parent columns repeat on each row
+    with engine.connect() as conn:
+        rows = conn.execute(_SQL_INQUIRY_WITH_STUDENTS, {"cn": contact_num}).fetchall()
+
+    if not rows:
+        return None  # No parent found
+
+    # Several tblInquiry rows may share a phone number; keep the first parent
+    parent = rows[0]
+    return {
+        "inquiry": {
+            "InquiryID": parent.InquiryID,
+            "Email": parent.Email,
+            "ContactPhone": parent.ContactPhone,
+        },
+        "students": [
+            {"ID": row.StudentID, "FirstName": row.FirstName, "LastName": row.LastName}
+            for row in rows
+            if row.InquiryID == parent.InquiryID and row.StudentID is not None
+        ]
+    }
 
 
 def get_hours_balance(inquiry_id):
-    conn = engine.raw_connection()
-    cursor = None
+    """
+    Hours balance for a parent, cached per inquiry_id for _BALANCE_CACHE_TTL.
+    Failed lookups are not cached.
+    """
+    with _BALANCE_CACHE_LOCK:
+        cached = _BALANCE_CACHE.get(inquiry_id)
+    if cached and datetime.now() - cached[0] < _BALANCE_CACHE_TTL:
+        return cached[1]
+
     try:
-        cursor = conn.cursor()
-        cursor.callproc("dpinkney_TC.dbo.USP_Report_AccountBalance", [inquiry_id])
+        balance_info = _fetch_hours_balance(inquiry_id)
+    except Exception as e:
+        return {
+            "balance": {},
+            "extra": [],
+            "remaining_hours": 0.0
+        }
+
+    now = datetime.now()
+    with _BALANCE_CACHE_LOCK:
+        if inquiry_id in _BALANCE_CACHE:
+            # Re-insert at the end so dict order stays oldest-load first
+            del _BALANCE_CACHE[inquiry_id]
+        elif len(_BALANCE_CACHE) >= _BALANCE_CACHE_MAX:
+            # Drop expired entries, then the oldest if still full
+            for key in [k for k, (loaded_at, _) in _BALANCE_CACHE.items() if now - loaded_at >= _BALANCE_CACHE_TTL]:
+                del _BALANCE_CACHE[key]
+            if len(_BALANCE_CACHE) >= _BALANCE_CACHE_MAX:
+                del _BALANCE_CACHE[next(iter(_BALANCE_CACHE))]
+        _BALANCE_CACHE[inquiry_id] = (now, balance_info)
+
+    return balance_info
+
+
+def invalidate_hours_balance(inquiry_id):
+    with _BALANCE_CACHE_LOCK:
+        _BALANCE_CACHE.pop(inquiry_id, None)
+
 
-        # Skip first result set
-        while cursor.nextset():
-            break
+def _fetch_hours_balance(inquiry_id):
+    # USP_Report_AccountBalance returns several result sets, so it still needs a
+    # DB-API cursor; borrow it from a pooled connection that the with-block returns.
+    with engine.connect() as conn, closing(conn.connection.cursor()) as cursor:
+        cursor.callproc("dpinkney_TC.dbo.USP_Report_AccountBalance", [inquiry_id])
 
         # Second result set (balance-related info)
+        cursor.nextset()
         balance_row = cursor.fetchone()
         balance_columns = [col[0] for col in cursor.description] if cursor.description else []
         balance_data = dict(zip(balance_columns, balance_row)) if balance_row else {}
 
         # Third result set (optional, in case you need it later)
-        while cursor.nextset():
-            break
-
+        cursor.nextset()
         extra_rows = cursor.fetchall()
         extra_columns = [col[0] for col in cursor.description] if cursor.description else []
         extra_data = [dict(zip(extra_columns, row)) for row in extra_rows]
 
-        # Define a helper to safely cast to float
-        def safe_float(val):
-            try:
-                result = float(val) if val is not None else 0.0
-                return result
-            except (TypeError, ValueError):
-                return 0.0
-
-        # Calculate remaining hours
-        purchases = safe_float(balance_data.get("Purchases"))
-        attendance = safe_float(balance_data.get("AttendancePresent"))
-        absences = safe_float(balance_data.get("UnexcusedAbsences"))
-        adjustments = safe_float(balance_data.get("MiscAdjustments"))
-        
-        remaining = purchases + attendance + absences + adjustments
+    # Define a helper to safely cast to float
+    def safe_float(val):
+        try:
+            result = float(val) if val is not None else 0.0
+            return result
+        except (TypeError, ValueError):
+            return 0.0
+
+    # Calculate remaining hours
+    purchases = safe_float(balance_data.get("Purchases"))
+    attendance = safe_float(balance_data.get("AttendancePresent"))
+    absences = safe_float(balance_data.get("UnexcusedAbsences"))
+    adjustments = safe_float(balance_data.get("MiscAdjustments"))
+    
+    remaining = purchases + attendance + absences + adjustments
 
-        return {
-            "balance": balance_data,
-            "extra": extra_data,
-            "remaining_hours": remaining
-        }
-
-    except Exception as e:
-        return {
-            "balance": {},
-            "extra": [],
-            "remaining_hours": 0.0
-        }
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    return {
+        "balance": balance_data,
+        "extra": extra_data,
+        "remaining_hours": remaining
+    }
 
 
 
 def get_sessions(student_id):
-    sql = text("""
-        SELECT Day, TimeID, ScheduleDate, StudentId1 
-        FROM dpinkney_TC.dbo.tblSessionSchedule 
-        WHERE StudentId1 = :sid
-    """)
-    with engine.connect() as conn:
-        result = conn.execute(sql, {"sid": student_id})
-        all_sessions = [dict(row._mapping) for row in result.fetchall()]
+    return get_sessions_bulk([student_id]).get(student_id, [])
 
-    # Current month and year
-    today = datetime.now().date()
-    current_month = today.month
-    current_year = today.year
 
-    recent_sessions = []
-    upcoming_sessions = []
+def get_sessions_bulk(student_ids):
+    """
+    Fetch sessions for several students in one query.
+    Returns a dict of {student_id: [sessions]} with every requested student present.
+    """
+    student_ids = list(student_ids)
+    if not student_ids:
+        return {}
+
+    # Only the current month is shown; let SQL Server do the filtering.
+    # Backed by an index on tblSessionSchedule (StudentId1, ScheduleDate).
+    today = datetime.now().date()
+    month_start = today.replace(day=1)
+    next_month_start = month_start + relativedelta(months=1)
 
-    for session in all_sessions:
-        try:
-            # Add formatted time
-            time_id = session.get("TimeID")
-            formatted_time = get_time(time_id) if time_id else "Unknown"
-            session["Time"] = formatted_time
+    with engine.connect() as conn:
+        result = conn.execute(_SQL_SESSIONS_BY_STUDENTS, {
+            "ids": student_ids,
+            "month_start": month_start,
+            "next_month_start": next_month_start,
+            "today": today,
+        })
 
-            # Normalize ScheduleDate
-            sched_raw = session.get("ScheduleDate")
+        # Rows arrive categorized and ordered recent-first. Keep the raw row tuples
+        # grouped by student; output dicts are only built for the rows _filter_sessions keeps
+        grouped = {student_id: [] for student_id in student_ids}
+        time_ids = set()
+        for row in result:
+            grouped.setdefault(row.StudentId1, []).append(row)
+            if row.TimeID:
+                time_ids.add(row.TimeID)
+
+        # Resolve every TimeID in one query instead of one per session
+        times = get_times_bulk(time_ids, conn)
+
+    return {
+        student_id: _filter_sessions(rows, times)
+        for student_id, rows in grouped.items()
+    }
+
+
+def _filter_sessions(rows, times):
+    sessions = []
+
+    for day, time_id, sched_raw, student_id, category in rows:
+        # ScheduleDate is a DATETIME column, which pymssql returns as datetime
+        if isinstance(sched_raw, datetime):
+            session_date = sched_raw.date()
+        elif isinstance(sched_raw, date):
+            session_date = sched_raw
+        else:
             session_date = None
-
-            if isinstance(sched_raw, datetime):
-                session_date = sched_raw.date()
-            elif isinstance(sched_raw, str):
+            if isinstance(sched_raw, str):
                 try:
-                    session_date = parse(sched_raw).date()
-                except Exception:
-                    continue
-            else:
-                continue
-
-            # Filter only current month & year
-            if session_date.month != current_month or session_date.year != current_year:
+                    session_date = date.fromisoformat(sched_raw[:10])
+                except ValueError:
+                    pass
+            if session_date is None:
+                logger.warning("Skipping session for student %s: unrecognized ScheduleDate %r (%s)",
+                               student_id, sched_raw, type(sched_raw).__name__)
                 continue
 
-            # Save formatted date and day
-            session["FormattedDate"] = session_date.strftime("%Y-%m-%d")
-            if not session.get("Day") or session["Day"].strip() == "":
-                session["Day"] = session_date.strftime("%A")
-
-            # Categorize
-            if session_date < today:
-                session["category"] = "recent"
-                recent_sessions.append(session)
-            else:
-                session["category"] = "upcoming"
-                upcoming_sessions.append(session)
-
-        except Exception as e:
-            session["category"] = "upcoming"
-            upcoming_sessions.append(session)
+        # Save formatted date and day
+        if not day or day.strip() == "":
+            day = session_date.strftime("%A")
+        sessions.append({
+            "Day": day,
+            "TimeID": time_id,
+            "ScheduleDate": sched_raw,
+            "StudentId1": student_id,
+            "Time": times.get(time_id, "Unknown"),
+            "FormattedDate": session_date.strftime("%Y-%m-%d"),
+            "category": category,
+        })
 
-    # Combine and return
-    return recent_sessions + upcoming_sessions
+    return sessions
 
 
 
@@ -199,29 +342,24 @@ def search_student():
     if not inquiry:
         return jsonify({"error": "Parent not found"}), 404
 
-    inquiry_id = inquiry["ID"]
+    inquiry_id = inquiry["inquiry"]["InquiryID"]
 
-    # Step 2: Get all students tied to this parent (InquiryID)
-    sql = text("""
-        SELECT ID, FirstName, LastName 
-        FROM tblstudents 
-        WHERE InquiryID = :inqID
-    """)
-    with engine.connect() as conn:
-        result = conn.execute(sql, {"inqID": inquiry_id})
-        students = [dict(row._mapping) for row in result.fetchall()]
+    # Step 2: Students tied to this parent came back with the inquiry lookup
+    students = inquiry["students"]
 
     if not students:
         return jsonify({"error": "No students found for this parent"}), 404
 
-    # Step 3: Get parent balance info
-    parent_info = get_hours_balance(inquiry_id)
-    parent_data = dict(parent_info) if parent_info else {}
+    # Step 3: Get parent balance info (runs alongside the session query)
+    balance_future = db_executor.submit(get_hours_balance, inquiry_id)
 
-    # Step 4: Attach session data for each student
+    # Step 4: Attach session data for all students in one query
+    sessions_by_student = get_sessions_bulk([student["ID"] for student in students])
     for student in students:
-        student_id = student["ID"]
-        student["sessions"] = get_sessions(student_id)
+        student["sessions"] = sessions_by_student.get(student["ID"], [])
+
+    parent_info = balance_future.result()
+    parent_data = dict(parent_info) if parent_info else {}
 
     return jsonify({
         "success": True,